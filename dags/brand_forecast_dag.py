@@ -1,5 +1,7 @@
 from datetime import datetime, timedelta
 from airflow import DAG
+from airflow.decorators import task
+from airflow.operators.empty import EmptyOperator
 from airflow.operators.python import PythonOperator
 import os
 import sys
@@ -13,16 +15,9 @@ SRC_PATH = os.path.join(BASE_DIR, "src")
 if SRC_PATH not in sys.path:
     sys.path.insert(0, SRC_PATH)
 
-# ==============================
-# ✅ Import modules from src/
-# ==============================
-from data_preprocessing import preprocess_data
-from get_trend_score import get_trend_score
-from generate_daily_sales import generate_historical_data  # Import existing function only
-from prophet_forecast import forecast_with_prophet
-from lstm_forecast import forecast_with_lstm
-from visualization import generate_visualizations
-from telegram_alert import send_telegram_message
+# NOTE: src/ modules are imported inside the task callables below, never at
+# module scope. The scheduler re-parses this file every ~30s, and pulling in
+# torch/prophet/sklearn/matplotlib on each parse costs seconds of CPU.
 
 # ==============================
 # ✅ DAG CONFIG
@@ -35,94 +30,121 @@ default_args = {
     "retry_delay": timedelta(minutes=2),
 }
 
-dag = DAG(
+with DAG(
     "brand_forecasting_pipeline",
     default_args=default_args,
     description="End-to-end brand forecasting pipeline (Prophet + LSTM)",
     schedule_interval=None,
     start_date=datetime(2024, 1, 1),
     catchup=False,
-)
-
-# ==============================
-# ✅ Task Wrappers
-# ==============================
-def task_generate_historical():
-    generate_historical_data()
-
-def task_collect_trends():
-    get_trend_score()
-
-def task_preprocess():
-    preprocess_data()
-
-def task_prophet():
-    forecast_with_prophet()
-
-def task_lstm():
-    forecast_with_lstm()
-
-def task_visualize():
-    generate_visualizations()
-
-def task_notify_success():
-    send_telegram_message("✅ DAG completed successfully! Forecast report generated.")
-
-def task_notify_failure(context):
-    send_telegram_message("❌ DAG Failed! Check Airflow logs.")
-
-# ==============================
-# ✅ Operators
-# ==============================
-t0 = PythonOperator(
-    task_id="generate_historical_data",
-    python_callable=task_generate_historical,
-    dag=dag,
-    on_failure_callback=task_notify_failure,
-)
-
-t2 = PythonOperator(
-    task_id="collect_trends",
-    python_callable=task_collect_trends,
-    dag=dag,
-    on_failure_callback=task_notify_failure,
-)
-
-t3 = PythonOperator(
-    task_id="preprocess_data",
-    python_callable=task_preprocess,
-    dag=dag,
-    on_failure_callback=task_notify_failure,
-)
-
-t4 = PythonOperator(
-    task_id="forecast_prophet",
-    python_callable=task_prophet,
-    dag=dag,
-    on_failure_callback=task_notify_failure,
-)
-
-t5 = PythonOperator(
-    task_id="forecast_lstm",
-    python_callable=task_lstm,
-    dag=dag,
-    on_failure_callback=task_notify_failure,
-)
-
-t6 = PythonOperator(
-    task_id="generate_visualizations",
-    python_callable=task_visualize,
-    dag=dag,
-    on_failure_callback=task_notify_failure,
-)
-
-t7 = PythonOperator(
-    task_id="notify_success",
-    python_callable=task_notify_success,
-    dag=dag,
-)
-
-# ==============================
-# ✅ Workflow dependencies
-# ==============================
-t0 >> t2 >> t3 >> [t4, t5] >> t6 >> t7
+) as dag:
+
+    # ==============================
+    # ✅ Task Wrappers
+    # ==============================
+    def task_generate_historical():
+        from generate_daily_sales import generate_historical_data
+        generate_historical_data()
+
+    def task_collect_trends():
+        from get_trend_score import get_trend_score
+        get_trend_score()
+
+    def task_preprocess():
+        from data_preprocessing import preprocess_data
+        preprocess_data()
+
+    def task_visualize():
+        from visualization import generate_visualizations
+        generate_visualizations()
+
+    def task_notify_success():
+        from telegram_alert import send_telegram_message
+        send_telegram_message("✅ DAG completed successfully! Forecast report generated.")
+
+    def task_notify_failure(context):
+        from telegram_alert import send_telegram_message
+        send_telegram_message("❌ DAG Failed! Check Airflow logs.")
+
+    # ==============================
+    # ✅ Dynamic task mapping: one forecast task per brand
+    # ==============================
+    @task(on_failure_callback=task_notify_failure)
+    def get_brand_list():
+        import pandas as pd
+        from data_preprocessing import PROCESSED_PARQUET
+        df = pd.read_parquet(PROCESSED_PARQUET, columns=["Brand"])
+        return sorted(df["Brand"].unique().tolist())
+
+    @task(on_failure_callback=task_notify_failure)
+    def forecast_prophet(brand):
+        from prophet_forecast import forecast_prophet_one
+        return forecast_prophet_one(brand)
+
+    @task(on_failure_callback=task_notify_failure)
+    def forecast_lstm(brand):
+        from lstm_forecast import forecast_lstm_one
+        return forecast_lstm_one(brand)
+
+    @task(on_failure_callback=task_notify_failure)
+    def combine_prophet_results(results):
+        from prophet_forecast import combine_prophet_forecasts
+        combine_prophet_forecasts(list(results))
+
+    @task(on_failure_callback=task_notify_failure)
+    def combine_lstm_results(results):
+        from lstm_forecast import combine_lstm_forecasts
+        combine_lstm_forecasts(list(results))
+
+    # ==============================
+    # ✅ Operators
+    # ==============================
+    t0 = PythonOperator(
+        task_id="generate_historical_data",
+        python_callable=task_generate_historical,
+        on_failure_callback=task_notify_failure,
+    )
+
+    t2 = PythonOperator(
+        task_id="collect_trends",
+        python_callable=task_collect_trends,
+        on_failure_callback=task_notify_failure,
+        # Cap concurrent Google Trends calls so we don't trip rate limits
+        # (pool created in airflow-init: airflow pools set trends_pool 2 ...)
+        pool="trends_pool",
+        pool_slots=1,
+    )
+
+    t3 = PythonOperator(
+        task_id="preprocess_data",
+        python_callable=task_preprocess,
+        on_failure_callback=task_notify_failure,
+    )
+
+    t6 = PythonOperator(
+        task_id="generate_visualizations",
+        python_callable=task_visualize,
+        on_failure_callback=task_notify_failure,
+    )
+
+    t7 = PythonOperator(
+        task_id="notify_success",
+        python_callable=task_notify_success,
+    )
+
+    # No-op hubs keep the fan-out/fan-in edge count linear instead of the
+    # O(N*M) cross product a bare [t4, t5] diamond creates once tasks map
+    fan_out = EmptyOperator(task_id="fan_out")
+    fan_in = EmptyOperator(task_id="fan_in")
+
+    # ==============================
+    # ✅ Workflow dependencies
+    # ==============================
+    brands = get_brand_list()
+    prophet_results = forecast_prophet.expand(brand=brands)
+    lstm_results = forecast_lstm.expand(brand=brands)
+    t4 = combine_prophet_results(prophet_results)
+    t5 = combine_lstm_results(lstm_results)
+
+    t0 >> t2 >> t3 >> fan_out >> brands
+    [t4, t5] >> fan_in >> t6 >> t7
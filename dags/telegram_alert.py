@@ -1,16 +1,37 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
 
+# One pooled session for the whole module: reuses the TLS connection across
+# messages (saves the handshake per call) and retries transient failures.
+_session = requests.Session()
+_session.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=8,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[429, 500, 502, 503, 504],
+            # urllib3 won't retry POST by default; both Telegram calls are
+            # POSTs and safe to resend on these statuses
+            allowed_methods=frozenset({"POST"}),
+        ),
+    ),
+)
+
 def send_telegram_message(message):
     if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
         print("❌ Telegram credentials missing!")
         return
-    
+
     url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    requests.post(url, json={"chat_id": TELEGRAM_CHAT_ID, "text": message})
+    _session.post(url, json={"chat_id": TELEGRAM_CHAT_ID, "text": message}, timeout=10)
 
 def send_telegram_document(file_path, caption="Forecast Report"):
     if not os.path.exists(file_path):
@@ -20,7 +41,12 @@ def send_telegram_document(file_path, caption="Forecast Report"):
     if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
         print("❌ Telegram credentials missing!")
         return
-    
+
     url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendDocument"
     with open(file_path, "rb") as file:
-        requests.post(url, data={"chat_id": TELEGRAM_CHAT_ID, "caption": caption}, files={"document": file})
+        _session.post(
+            url,
+            data={"chat_id": TELEGRAM_CHAT_ID, "caption": caption},
+            files={"document": file},
+            timeout=30,
+        )
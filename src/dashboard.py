@@ -10,22 +10,35 @@ st.set_page_config(page_title="Brand Forecast Dashboard", layout="wide")
 st.title("📊 Brand Forecasting Dashboard")
 
 # ================= LOAD DATA =====================
-sales_df = pd.read_csv(os.path.join(DATA_DIR, "processed", "processed_sales.csv"))
+# Cached loaders: Streamlit reruns the whole script on every widget change,
+# so keep CSV parsing out of the rerun path. The mtime argument is part of
+# the cache key, which auto-invalidates when Airflow rewrites a file.
+@st.cache_data(show_spinner=False)
+def load_csv(path, mtime, date_col=None):
+    df = pd.read_csv(path)
+    if date_col and date_col in df.columns:
+        df[date_col] = pd.to_datetime(df[date_col])
+    return df
+
+def load_csv_if_exists(path, date_col=None):
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    return load_csv(path, os.path.getmtime(path), date_col)
+
+@st.cache_data(show_spinner=False)
+def load_parquet(path, mtime):
+    return pd.read_parquet(path, engine="pyarrow")  # Date arrives pre-typed
+
+sales_path = os.path.join(DATA_DIR, "processed", "processed_sales.parquet")
+sales_df = load_parquet(sales_path, os.path.getmtime(sales_path))
 
 prophet_path = os.path.join(FORECAST_DIR, "prophet_forecast_results.csv")
 lstm_path = os.path.join(FORECAST_DIR, "lstm_forecast_results.csv")
 metrics_path = os.path.join(FORECAST_DIR, "prophet_metrics.csv")
 
-prophet_df = pd.read_csv(prophet_path) if os.path.exists(prophet_path) else pd.DataFrame()
-lstm_df = pd.read_csv(lstm_path) if os.path.exists(lstm_path) else pd.DataFrame()
-metrics = pd.read_csv(metrics_path) if os.path.exists(metrics_path) else pd.DataFrame()
-
-# Convert date columns
-sales_df["Date"] = pd.to_datetime(sales_df["Date"])
-if not prophet_df.empty:
-    prophet_df["Date"] = pd.to_datetime(prophet_df["Date"])
-if not lstm_df.empty:
-    lstm_df["Date"] = pd.to_datetime(lstm_df["Date"])
+prophet_df = load_csv_if_exists(prophet_path, "Date")
+lstm_df = load_csv_if_exists(lstm_path, "Date")
+metrics = load_csv_if_exists(metrics_path)
 
 # ================= SIDEBAR FILTERS ==================
 st.sidebar.header("🔍 Filters")
@@ -52,22 +65,35 @@ if prophet_df.empty:
 # ================= TOP SUMMARY CARDS ==================
 st.markdown("### Branch Overview")
 
-# This month revenue (sum of Total_Sales for latest month)
-this_month = sales_df["Date"].dt.to_period("M").max()
-this_month_sales = sales_df[sales_df["Date"].dt.to_period("M") == this_month]["Total_Sales"].sum()
-
-# Next month projected revenue from Prophet
-next_month = prophet_df["Date"].dt.to_period("M").max()
-next_month_sales = prophet_df[prophet_df["Date"].dt.to_period("M") == next_month]["Predicted_Sales"].sum()
-
-# Fastest growing brand (by Growth from your growth_df)
-last_actual_month = sales_df["Date"].dt.to_period("M").max()
-last_actual = sales_df[sales_df["Date"].dt.to_period("M") == last_actual_month] \
-    .groupby("Brand")["Total_Sales"].sum().reset_index().rename(columns={"Total_Sales": "Last_Month_Sales"})
-next_month_forecast = prophet_df[prophet_df["Date"].dt.to_period("M") == next_month]
-growth_df_all = next_month_forecast.groupby("Brand")["Predicted_Sales"].sum().reset_index()
-growth_df_all = growth_df_all.merge(last_actual, on="Brand", how="left")
-growth_df_all["Growth"] = growth_df_all["Predicted_Sales"] - growth_df_all["Last_Month_Sales"]
+# These aggregations only depend on the pipeline outputs, never on widget
+# state, so cache them keyed by file mtimes. The underscore-prefixed frames
+# are excluded from hashing (the mtimes already identify their version).
+@st.cache_data(show_spinner=False)
+def compute_summary(_sales_df, _prophet_df, sales_mtime, prophet_mtime):
+    # Month periods are needed several times below; compute each series once
+    sales_month = _sales_df["Date"].dt.to_period("M")
+    prophet_month = _prophet_df["Date"].dt.to_period("M")
+
+    # This month revenue (sum of Total_Sales for latest month)
+    this_month = sales_month.max()
+    this_month_sales = _sales_df[sales_month == this_month]["Total_Sales"].sum()
+
+    # Next month projected revenue from Prophet
+    next_month = prophet_month.max()
+    next_month_sales = _prophet_df[prophet_month == next_month]["Predicted_Sales"].sum()
+
+    # Fastest growing brand (by Growth from your growth_df)
+    last_actual = _sales_df[sales_month == this_month] \
+        .groupby("Brand")["Total_Sales"].sum().reset_index().rename(columns={"Total_Sales": "Last_Month_Sales"})
+    next_month_forecast = _prophet_df[prophet_month == next_month]
+    growth_df_all = next_month_forecast.groupby("Brand")["Predicted_Sales"].sum().reset_index()
+    growth_df_all = growth_df_all.merge(last_actual, on="Brand", how="left")
+    growth_df_all["Growth"] = growth_df_all["Predicted_Sales"] - growth_df_all["Last_Month_Sales"]
+    return this_month_sales, next_month_sales, growth_df_all
+
+this_month_sales, next_month_sales, growth_df_all = compute_summary(
+    sales_df, prophet_df, os.path.getmtime(sales_path), os.path.getmtime(prophet_path)
+)
 
 if not growth_df_all.empty:
     fastest_row = growth_df_all.sort_values("Growth", ascending=False).iloc[0]
@@ -92,15 +118,22 @@ with c4:
 # ================= CATEGORY LEADERS ==================
 st.markdown("### Category Leaders (Best Sellers)")
 
-# total sales per Brand & Category over last actual month
-cat_scope = sales_df[sales_df["Date"].dt.to_period("M") == last_actual_month]
+# total sales per Brand & Category over last actual month (cached like the
+# summary cards: only recomputed when the processed file changes)
+@st.cache_data(show_spinner=False)
+def compute_category_leaders(_sales_df, sales_mtime):
+    sales_month = _sales_df["Date"].dt.to_period("M")
+    cat_scope = _sales_df[sales_month == sales_month.max()]
+    if "Category" not in cat_scope.columns:
+        return None
+    return cat_scope.groupby(["Category", "Brand"])["Total_Sales"].sum().reset_index()
 
-if "Category" in cat_scope.columns:
-    cat_group = cat_scope.groupby(["Category", "Brand"])["Total_Sales"].sum().reset_index()
+cat_group = compute_category_leaders(sales_df, os.path.getmtime(sales_path))
 
-    def top_n_for_category(cat, n=3):
-        sub = cat_group[cat_group["Category"] == cat].sort_values("Total_Sales", ascending=False).head(n)
-        return sub[["Brand", "Total_Sales"]]
+if cat_group is not None:
+    # One nlargest pass over all groups instead of a filtered full sort
+    # per category; slice the (Category, Brand)-indexed result per column
+    top_by_cat = cat_group.set_index("Brand").groupby("Category")["Total_Sales"].nlargest(3)
 
     cols_cat = st.columns(4)
     categories = ["Dairy", "Beverages", "Snacks", "Personal Care"]
@@ -108,18 +141,28 @@ if "Category" in cat_scope.columns:
     for col, cat in zip(cols_cat, categories):
         with col:
             st.markdown(f"**{cat.upper()}**")
-            top_cat = top_n_for_category(cat, 3)
-            if top_cat.empty:
+            if cat not in top_by_cat.index.get_level_values(0):
                 st.caption("No data")
             else:
-                for _, row in top_cat.iterrows():
-                    st.write(f"{row['Brand']}: {row['Total_Sales']:,.0f}")
+                for brand, total_sales in top_by_cat.xs(cat, level=0).items():
+                    st.write(f"{brand}: {total_sales:,.0f}")
 else:
     st.info("Category column not available in processed data. Re-run preprocessing if you need category leaders.")
 
 # ================= FILTER DATA FOR SELECTED BRAND ==================
-actual = sales_df[(sales_df["Brand"] == selected_brand) &
-                  (sales_df["Date"].between(date_range[0], date_range[1]))]
+# A sorted (Brand, Date) MultiIndex turns the brand + date-range filter into
+# a binary-search slice instead of two full-column scans per rerun.
+@st.cache_data(show_spinner=False)
+def index_sales(_sales_df, sales_mtime):
+    return _sales_df.set_index(["Brand", "Date"]).sort_index()
+
+sales_idx = index_sales(sales_df, os.path.getmtime(sales_path))
+# selectbox returns None when the search matched no brand — .loc would
+# KeyError on that, so bail out before slicing
+if selected_brand is None:
+    st.info("No brand matches your search. Adjust the filter to see charts.")
+    st.stop()
+actual = sales_idx.loc[(selected_brand, slice(date_range[0], date_range[1])), :].reset_index()
 
 prophet = prophet_df[prophet_df["Brand"] == selected_brand]
 lstm = lstm_df[lstm_df["Brand"] == selected_brand] if not lstm_df.empty else pd.DataFrame()
@@ -12,7 +12,9 @@ RAW_DATA_FILE = os.path.join(DATA_DIR, "raw", "brand_sales_dataset.csv")
 PROCESSED_DIR = os.path.join(DATA_DIR, "processed")
 os.makedirs(PROCESSED_DIR, exist_ok=True)
 
-PROCESSED_FILE = os.path.join(PROCESSED_DIR, "processed_sales.csv")
+PROCESSED_PARQUET = os.path.join(PROCESSED_DIR, "processed_sales.parquet")
+
+CHUNK_SIZE = 200_000  # rows per read_csv chunk; keeps peak memory bounded
 
 def preprocess_data():
     """Preprocess raw data: fill missing, encode categorical, feature engineer, aggregate."""
@@ -20,29 +22,40 @@ def preprocess_data():
     if not os.path.exists(RAW_DATA_FILE):
         raise FileNotFoundError(f"{RAW_DATA_FILE} not found. Generate raw data first.")
 
-    df = pd.read_csv(RAW_DATA_FILE)
-
-    print(f"Loaded raw data with {len(df)} rows.")
-
-    # Handle missing values
-    df["Online_Popularity"] = df["Online_Popularity"].fillna(df["Online_Popularity"].median())
-    df["Total_Sales"] = df["Total_Sales"].fillna(df["Total_Sales"].median())
-    df["Quantity_Sold"] = df["Quantity_Sold"].fillna(df["Quantity_Sold"].median())
-
     numeric_fill_cols = [
+        "Online_Popularity", "Total_Sales", "Quantity_Sold",
         "Competitor_Price", "Category_Trend_Index", "Customer_Growth_Rate",
         "Customer_Retention_Rate", "Stock_Level", "Supply_Delay_Days",
         "Inflation_Rate", "Weather_Score"
     ]
-    for col in numeric_fill_cols:
-        if col in df.columns:
-            df[col] = df[col].fillna(df[col].median())
 
-    if "Is_Holiday" in df.columns:
-        df["Is_Holiday"] = df["Is_Holiday"].fillna(0)
+    # Pass 1: stream only the numeric columns to compute global medians,
+    # so the full-width frame never has to be resident for the fill step.
+    header_cols = pd.read_csv(RAW_DATA_FILE, nrows=0).columns
+    median_cols = [col for col in numeric_fill_cols if col in header_cols]
+    column_parts = {col: [] for col in median_cols}
+    for chunk in pd.read_csv(RAW_DATA_FILE, chunksize=CHUNK_SIZE, usecols=median_cols):
+        for col in median_cols:
+            column_parts[col].append(chunk[col].to_numpy())
+    medians = {col: float(np.nanmedian(np.concatenate(column_parts[col]))) for col in median_cols}
+    del column_parts
+
+    # Pass 2: clean chunk by chunk with the precomputed medians, then concat
+    # the already-cleaned chunks for the downstream feature engineering.
+    cleaned_chunks = []
+    for chunk in pd.read_csv(RAW_DATA_FILE, chunksize=CHUNK_SIZE):
+        for col in median_cols:
+            chunk[col] = chunk[col].fillna(medians[col])
+        if "Is_Holiday" in chunk.columns:
+            chunk["Is_Holiday"] = chunk["Is_Holiday"].fillna(0)
+        chunk["Date"] = pd.to_datetime(chunk["Date"], errors="coerce")
+        cleaned_chunks.append(chunk)
+    df = pd.concat(cleaned_chunks, ignore_index=True)
+    del cleaned_chunks
 
-    # Convert Date to datetime and sort data
-    df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
+    print(f"Loaded raw data with {len(df)} rows.")
+
+    # Sort data per brand for the lag/rolling features below
     df = df.sort_values(by=["Brand", "Date"])
 
     # Encode categorical columns
@@ -53,11 +66,16 @@ def preprocess_data():
         label_encoders[col] = le
 
     # Feature engineering: lags and rolling mean for Total_Sales per brand
+    # Native groupby kernels (Cython) instead of per-group Python lambdas
     df["Sales_Lag_1"] = df.groupby("Brand")["Total_Sales"].shift(1)
-    df["Sales_MA_3"] = df.groupby("Brand")["Total_Sales"].transform(lambda x: x.rolling(3, min_periods=1).mean())
+    df["Sales_MA_3"] = (
+        df.groupby("Brand")["Total_Sales"]
+        .rolling(3, min_periods=1).mean()
+        .reset_index(level=0, drop=True)
+    )
 
-    # Use transform with ffill and bfill to avoid index issues
-    df["Sales_Lag_1"] = df.groupby("Brand")["Sales_Lag_1"].transform(lambda x: x.ffill().bfill())
+    df["Sales_Lag_1"] = df.groupby("Brand")["Sales_Lag_1"].ffill()
+    df["Sales_Lag_1"] = df.groupby("Brand")["Sales_Lag_1"].bfill()
 
     # For any remaining NaNs in rolling mean, fill with Total_Sales
     df["Sales_MA_3"].fillna(df["Total_Sales"], inplace=True)
@@ -71,9 +89,11 @@ def preprocess_data():
         "Inflation_Rate", "Weather_Score"
     ]
     existing_numeric_cols = [col for col in numeric_cols_to_normalize if col in df.columns]
-    df[existing_numeric_cols] = df[existing_numeric_cols].apply(
-        lambda x: (x - x.mean()) / (x.std() + 1e-6)
-    )
+    # Single broadcast over the 2-D array instead of a per-column lambda
+    arr = df[existing_numeric_cols].to_numpy(dtype=np.float32)
+    mean = arr.mean(axis=0, keepdims=True)
+    std = arr.std(axis=0, keepdims=True) + 1e-6
+    df[existing_numeric_cols] = (arr - mean) / std
 
     # Aggregate by Category, Brand and Date to get unique daily summary rows for forecasting
     agg_dict = {
@@ -103,9 +123,11 @@ def preprocess_data():
     # ✅ group by Category as well so it's preserved
     df_agg = df.groupby(["Category", "Brand", "Date"], as_index=False).agg(agg_dict)
 
-    # Save the processed aggregated data for forecasting
-    df_agg.to_csv(PROCESSED_FILE, index=False)
-    print(f"Processed data saved with {len(df_agg)} rows to {PROCESSED_FILE}")
+    # Save the processed aggregated data for forecasting.
+    # Every consumer now reads Parquet (typed, columnar, ~10x faster reload),
+    # so the legacy CSV copy is no longer written.
+    df_agg.to_parquet(PROCESSED_PARQUET, engine="pyarrow", compression="snappy")
+    print(f"Processed data saved with {len(df_agg)} rows to {PROCESSED_PARQUET}")
 
     return df_agg
 
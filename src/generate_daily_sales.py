@@ -2,7 +2,11 @@ import pandas as pd
 import random
 from datetime import datetime, timedelta
 from pytrends.request import TrendReq
+from joblib import Parallel, delayed
 import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import json
 import os
 import time
 import requests  # optional, for clearer exception messages
@@ -21,6 +25,9 @@ HISTORICAL_DAYS = 90   # Ensure multi-day historical coverage
 
 REGIONS = ["Maharashtra", "Tamil Nadu", "Karnataka", "Delhi", "Gujarat"]
 
+# National holidays as month-day strings; frozenset for O(1) membership
+HOLIDAYS = frozenset({"01-26", "08-15", "10-02", "12-25"})
+
 categories = {
     "Beverages": ["Coca-Cola", "Pepsi", "Fanta", "Thums Up", "Sprite", "Maaza"],
     "Dairy": ["Amul", "Mother Dairy", "Britannia", "Parag", "Gowardhan"],
@@ -28,8 +35,35 @@ categories = {
     "Personal Care": ["Dove", "Pond's", "Lifebuoy", "Patanjali", "Himalaya"]
 }
 
-# Cache dictionary to store trend scores per brand
-trend_cache = {}
+CACHE_DIR = os.path.join(DATA_DIR, "cache")
+os.makedirs(CACHE_DIR, exist_ok=True)
+
+TREND_CACHE_FILE = os.path.join(CACHE_DIR, "trends.json")
+TREND_CACHE_TTL = 86400  # seconds; re-fetch trend scores at most once a day
+
+def _load_trend_cache():
+    """Load the persisted trend cache if it is younger than the TTL."""
+    if (
+        os.path.exists(TREND_CACHE_FILE)
+        and time.time() - os.path.getmtime(TREND_CACHE_FILE) < TREND_CACHE_TTL
+    ):
+        try:
+            with open(TREND_CACHE_FILE) as f:
+                return json.load(f)
+        except (ValueError, OSError) as e:
+            print(f"⚠️ Could not load trend cache: {e}. Starting fresh.")
+    return {}
+
+def _save_trend_cache():
+    try:
+        with open(TREND_CACHE_FILE, "w") as f:
+            json.dump(trend_cache, f)
+    except OSError as e:
+        print(f"⚠️ Could not persist trend cache: {e}")
+
+# Cache dictionary to store trend scores per brand.
+# Persisted to disk so re-runs within 24h skip pytrends entirely.
+trend_cache = _load_trend_cache()
 
 def get_trend_score(brand: str) -> float:
     if brand in trend_cache:
@@ -50,13 +84,22 @@ def get_trend_score(brand: str) -> float:
         score = random.uniform(30, 80)
 
     trend_cache[brand] = score
+    _save_trend_cache()
     return score
 
-def generate_brand_sales(date: str):
-    rows = []
-    dt = datetime.strptime(date, "%Y-%m-%d")
+def warm_trend_cache():
+    """Fetch every brand's trend score once (sequential, network-bound).
 
-    holidays = ["01-26", "08-15", "10-02", "12-25"]
+    Returns a plain dict so it can be shipped to joblib workers, which do
+    not share this module's in-process cache.
+    """
+    for brand_list in categories.values():
+        for brand in brand_list:
+            get_trend_score(brand)
+    return dict(trend_cache)
+
+def generate_brand_sales(date: str, brand_scores=None):
+    dt = datetime.strptime(date, "%Y-%m-%d")
 
     # Create list of all brands with their categories
     all_brands = []
@@ -68,62 +111,71 @@ def generate_brand_sales(date: str):
     all_choices = all_brands * repeats
     random.shuffle(all_choices)
 
-    for category, brand in all_choices:
-        trend_score = get_trend_score(brand)  # Cached call per brand
-        base_sales = random.randint(1000, 10000)
-        seasonal_multiplier = 1 + 0.1 * np.sin(dt.timetuple().tm_yday / 365 * 2 * np.pi)
-        trend_multiplier = 0.8 + (trend_score / 100) * 0.4
-        total_sales = base_sales * seasonal_multiplier * trend_multiplier * random.uniform(0.8, 1.2)
-        quantity_sold = int(total_sales / random.uniform(20, 250))
-        region = random.choice(REGIONS)
-        promotion = random.choice([0, 1]) if random.random() < 0.15 else 0
-        discount_pct = random.choice([0, 5, 10, 15, 20]) if promotion else 0
-        competitor_price = random.uniform(50, 500)
-        category_trend_index = round(random.uniform(0.8, 1.3), 2)
-        customer_growth_rate = round(random.uniform(-0.02, 0.05), 4)
-        retention_rate = round(random.uniform(0.65, 0.95), 2)
-        stock_level = random.randint(500, 5000)
-        supply_delay = random.choice([0, 1, 2, 3])
-        inflation_rate = round(random.uniform(4.5, 9.5), 2)
-        weather_score = random.uniform(60, 100) if category == "Beverages" else random.uniform(40, 90)
-        is_holiday = 1 if dt.strftime("%m-%d") in holidays else 0
-
-        rows.append({
-            "Date": date,
-            "Category": category,
-            "Brand": brand,
-            "Region": region,
-            "Promotion": promotion,
-            "Total_Sales": round(total_sales, 2),
-            "Quantity_Sold": quantity_sold,
-            "Online_Popularity": round(trend_score, 2),
-            "Discount_Percentage": discount_pct,
-            "Month": dt.month,
-            "Week": dt.isocalendar().week,
-            "Is_Holiday": is_holiday,
-            "Competitor_Price": round(competitor_price, 2),
-            "Category_Trend_Index": category_trend_index,
-            "Customer_Growth_Rate": customer_growth_rate,
-            "Customer_Retention_Rate": retention_rate,
-            "Stock_Level": stock_level,
-            "Supply_Delay_Days": supply_delay,
-            "Inflation_Rate": inflation_rate,
-            "Weather_Score": round(weather_score, 2)
-        })
-
-    return rows
+    # One cached trend lookup per distinct brand, broadcast across rows
+    if brand_scores is None:
+        brand_scores = {brand: get_trend_score(brand) for _, brand in all_brands}
+
+    n = len(all_choices)
+    category_arr = np.array([category for category, _ in all_choices])
+    brand_arr = np.array([brand for _, brand in all_choices])
+    trend_scores = np.array([brand_scores[brand] for brand in brand_arr])
+
+    # Draw every column as one NumPy batch instead of n per-row calls
+    rng = np.random.default_rng()
+    base_sales = rng.integers(1000, 10001, n)
+    seasonal_multiplier = 1 + 0.1 * np.sin(dt.timetuple().tm_yday / 365 * 2 * np.pi)
+    trend_multiplier = 0.8 + (trend_scores / 100) * 0.4
+    total_sales = base_sales * seasonal_multiplier * trend_multiplier * rng.uniform(0.8, 1.2, n)
+    quantity_sold = (total_sales / rng.uniform(20, 250, n)).astype(int)
+    promotion = np.where(rng.random(n) < 0.15, rng.integers(0, 2, n), 0)
+    discount_pct = np.where(promotion == 1, rng.choice([0, 5, 10, 15, 20], n), 0)
+    weather_score = np.where(
+        category_arr == "Beverages",
+        rng.uniform(60, 100, n),
+        rng.uniform(40, 90, n),
+    )
+    is_holiday = 1 if dt.strftime("%m-%d") in HOLIDAYS else 0  # once per day, not per row
+
+    return pd.DataFrame({
+        "Date": date,
+        "Category": category_arr,
+        "Brand": brand_arr,
+        "Region": rng.choice(REGIONS, n),
+        "Promotion": promotion,
+        "Total_Sales": np.round(total_sales, 2),
+        "Quantity_Sold": quantity_sold,
+        "Online_Popularity": np.round(trend_scores, 2),
+        "Discount_Percentage": discount_pct,
+        "Month": dt.month,
+        "Week": int(dt.isocalendar().week),
+        "Is_Holiday": is_holiday,
+        "Competitor_Price": np.round(rng.uniform(50, 500, n), 2),
+        "Category_Trend_Index": np.round(rng.uniform(0.8, 1.3, n), 2),
+        "Customer_Growth_Rate": np.round(rng.uniform(-0.02, 0.05, n), 4),
+        "Customer_Retention_Rate": np.round(rng.uniform(0.65, 0.95, n), 2),
+        "Stock_Level": rng.integers(500, 5001, n),
+        "Supply_Delay_Days": rng.choice([0, 1, 2, 3], n),
+        "Inflation_Rate": np.round(rng.uniform(4.5, 9.5, n), 2),
+        "Weather_Score": np.round(weather_score, 2)
+    })
 
 def generate_historical_data():
     start_date = datetime.now() - timedelta(days=HISTORICAL_DAYS)
-    all_rows = []
-    for i in range(HISTORICAL_DAYS):
-        date = (start_date + timedelta(days=i)).strftime("%Y-%m-%d")
-        print(f"Generating data for {date}")  # Progress log
-        rows = generate_brand_sales(date)
-        all_rows.extend(rows)
-        time.sleep(0.1)  # Reduced sleep to speed up (adjust if necessary)
-    df = pd.DataFrame(all_rows)
-    df.to_csv(RAW_FILE, mode="w", header=True, index=False)
+    date_strs = [
+        (start_date + timedelta(days=i)).strftime("%Y-%m-%d")
+        for i in range(HISTORICAL_DAYS)
+    ]
+
+    # Warm the trend cache once up front so workers never hit the network,
+    # then generate the independent days in parallel across all cores
+    brand_scores = warm_trend_cache()
+    print(f"Generating data for {len(date_strs)} days in parallel...")
+    daily_frames = Parallel(n_jobs=os.cpu_count())(
+        delayed(generate_brand_sales)(date, brand_scores) for date in date_strs
+    )
+    df = pd.concat(daily_frames, ignore_index=True)
+    # Arrow's C++ CSV writer is several times faster than pandas' to_csv
+    pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), RAW_FILE)
     print(f"✅ Generated {HISTORICAL_DAYS} days of historical data ({len(df)} rows)")
 
 def validate_data():
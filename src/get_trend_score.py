@@ -14,21 +14,33 @@ DATA_FILE = os.path.join(DATA_DIR, "brand_sales_dataset.csv")
 # GOOGLE TRENDS HELPER
 # =======================================
 
-def fetch_trend_score(brand: str) -> float:
-    """Fetch the current Google Trends score for a brand."""
+PYTRENDS_BATCH_SIZE = 5  # pytrends accepts up to 5 keywords per payload
+
+def fetch_trend_scores(brands) -> dict:
+    """Fetch Google Trends scores for many brands, batched 5 per request."""
     # Initialize pytrends INSIDE the function so Airflow import does not hit network
     pytrends = TrendReq(hl="en-US", tz=330, timeout=(10, 25))
-    try:
-        pytrends.build_payload([brand], timeframe="now 7-d", geo="IN")
-        data = pytrends.interest_over_time()
-        if not data.empty:
-            return float(data[brand].iloc[-1])
-        else:
-            return random.uniform(30, 80)
-    except Exception as e:
-        # Handle timeouts or rate limits gracefully
-        print(f"⚠️ Trend fetch failed for {brand}: {e}. Using random score.")
-        return random.uniform(30, 80)
+    brands = list(brands)
+    scores = {}
+    for start in range(0, len(brands), PYTRENDS_BATCH_SIZE):
+        group = brands[start:start + PYTRENDS_BATCH_SIZE]
+        try:
+            pytrends.build_payload(group, timeframe="now 7-d", geo="IN")
+            data = pytrends.interest_over_time()
+        except Exception as e:
+            # Handle timeouts or rate limits gracefully
+            print(f"⚠️ Trend fetch failed for {group}: {e}. Using random scores.")
+            data = pd.DataFrame()
+        for brand in group:
+            if not data.empty and brand in data.columns:
+                scores[brand] = float(data[brand].iloc[-1])
+            else:
+                scores[brand] = random.uniform(30, 80)
+    return scores
+
+def fetch_trend_score(brand: str) -> float:
+    """Fetch the current Google Trends score for a single brand."""
+    return fetch_trend_scores([brand])[brand]
 
 # ✅ Function Airflow expects
 def fetch_google_trends():
@@ -45,15 +57,15 @@ def fetch_google_trends():
 
     latest_df = df[df["Date"] == latest_date].copy()
 
-    updated_scores = []
-    for brand in latest_df["Brand"].unique():
-        trend_score = fetch_trend_score(brand)
-        updated_scores.append({"Brand": brand, "Online_Popularity": trend_score})
+    # Batched fetch: 5 brands per pytrends payload instead of 1 each
+    brand_scores = fetch_trend_scores(latest_df["Brand"].unique())
+
+    for brand, trend_score in brand_scores.items():
         print(f"🔹 {brand}: {trend_score:.2f}")
 
-    scores_df = pd.DataFrame(updated_scores)
-    df = df.drop(columns=["Online_Popularity"], errors="ignore")
-    df = df.merge(scores_df, on="Brand", how="left")
+    # In-place map beats a merge here: no joined copy of the whole frame,
+    # just one C-level dict lookup pass over the Brand column
+    df["Online_Popularity"] = df["Brand"].map(brand_scores)
 
     df.to_csv(DATA_FILE, index=False)
     print(f"✅ Trend scores updated and saved to {DATA_FILE}")
@@ -1,11 +1,17 @@
 import pandas as pd
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import torch
 import torch.nn as nn
-from sklearn.preprocessing import MinMaxScaler
-from sklearn.metrics import mean_squared_error, mean_absolute_percentage_error
 import os
 
+try:
+    import numba
+except ImportError:  # optional: NumPy fallback below covers missing numba
+    numba = None
+
 # =======================================
 # CONFIG
 # =======================================
@@ -13,11 +19,23 @@ DATA_DIR = "data"
 FORECAST_DIR = os.path.join(DATA_DIR, "forecast")
 os.makedirs(FORECAST_DIR, exist_ok=True)
 
-PROCESSED_FILE = os.path.join(DATA_DIR, "processed", "processed_sales.csv")
+PROCESSED_FILE = os.path.join(DATA_DIR, "processed", "processed_sales.parquet")
 FORECAST_FILE = os.path.join(FORECAST_DIR, "lstm_forecast_results.csv")
 METRICS_FILE = os.path.join(FORECAST_DIR, "lstm_metrics.csv")
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+torch.set_float32_matmul_precision("high")  # unlock TF32 tensor cores on Ampere+
+
+extra_regressors = [
+    "Competitor_Price", "Category_Trend_Index", "Customer_Growth_Rate",
+    "Customer_Retention_Rate", "Stock_Level", "Supply_Delay_Days",
+    "Inflation_Rate", "Weather_Score", "Is_Holiday"
+]
+
+SEQ_LENGTH = 7    # Use previous 7 days to predict next day
+FORECAST_DAYS = 30
+EPOCHS = 80
+BATCH_SIZE = 1024
 
 # =======================================
 # LSTM MODEL DEFINITION
@@ -32,6 +50,273 @@ class LSTMModel(nn.Module):
         out, _ = self.lstm(x)            # output shape: (batch, seq_len, hidden_dim)
         return self.fc(out[:, -1, :])    # use output at last time step
 
+# =======================================
+# DATA PREP / TRAINING HELPERS
+# =======================================
+def _to_device(tensor):
+    """Stage a CPU tensor through pinned memory for an async H2D copy."""
+    if device.type == "cuda":
+        tensor = tensor.pin_memory()
+    return tensor.to(device, non_blocking=True)
+
+def _append_onehot(X, onehot):
+    """Append a static one-hot vector to every timestep of an (N, L, F) batch."""
+    tail = np.broadcast_to(onehot, (X.shape[0], X.shape[1], onehot.size))
+    return np.concatenate([X, tail], axis=2).astype(np.float32)
+
+if numba is not None:
+    @numba.njit(cache=True, parallel=True)
+    def _build_sequences_jit(scaled, seq_length):
+        n = scaled.shape[0] - seq_length
+        f = scaled.shape[1]
+        X = np.empty((n, seq_length, f), np.float32)
+        y = np.empty(n, np.float32)
+        for i in numba.prange(n):
+            X[i] = scaled[i:i + seq_length]
+            y[i] = scaled[i + seq_length, 0]
+        return X, y
+
+def _build_sequences(scaled, seq_length):
+    """Window the scaled history into (X, y) pairs; y is scaled Total_Sales.
+
+    Uses the Numba-compiled SIMD loop when available (first call pays the
+    JIT cost, later brands hit the on-disk cache); otherwise falls back to
+    zero-copy sliding windows plus one contiguous cast.
+    """
+    if numba is not None:
+        return _build_sequences_jit(scaled, seq_length)
+    windows = sliding_window_view(scaled, (seq_length, scaled.shape[1]))[:-1, 0]
+    X = np.ascontiguousarray(windows, dtype=np.float32)
+    y = scaled[seq_length:, 0].astype(np.float32)
+    return X, y
+
+def _aggregate_daily(df):
+    """One global (Brand, Date) aggregation to get unique date-brand pairs.
+
+    A single Cython groupby pass up front replaces the per-brand
+    groupby("Date") that used to run inside every loop iteration.
+    """
+    agg_dict = {
+        "Total_Sales": "sum",
+        "Online_Popularity": "mean"
+    }
+    for reg in extra_regressors:
+        if reg in df.columns:
+            agg_dict[reg] = "mean"
+    return df.groupby(["Brand", "Date"], sort=True, observed=True, as_index=False).agg(agg_dict)
+
+def _prepare_brand(brand, brand_df):
+    """Scale and window one brand's history into train/test arrays.
+
+    Expects the frame pre-aggregated by _aggregate_daily (sorted, one row
+    per date). Returns None when the brand lacks enough rows to train on.
+    """
+    seq_length = SEQ_LENGTH
+
+    # Prepare features and verify their existence
+    features = ["Total_Sales", "Online_Popularity"] + [reg for reg in extra_regressors if reg in brand_df.columns]
+
+    if len(brand_df) < seq_length + 1:
+        print(f"Skipping {brand}: insufficient rows ({len(brand_df)}) to form sequences.")
+        return None
+
+    feature_array = brand_df[features].to_numpy(dtype=np.float64)
+
+    # Plain NumPy min-max scaling: sklearn's fit/transform/inverse_transform
+    # carry per-call overhead and copies that dominate at this array size
+    data_min = feature_array.min(axis=0)
+    data_range = np.ptp(feature_array, axis=0)
+    data_range[data_range == 0] = 1.0  # constant columns scale to zero
+    scaled = (feature_array - data_min) / data_range
+
+    X, y = _build_sequences(scaled, seq_length)
+
+    if len(X) < 20:
+        print(f"Skipping {brand}: not enough samples ({len(X)}) after sequence creation.")
+        return None
+
+    train_size = int(len(X) * 0.8)
+    return {
+        "brand": brand,
+        "brand_df": brand_df,
+        "features": features,
+        "data_min": data_min,
+        "data_range": data_range,
+        "scaled": scaled,
+        "X_train": X[:train_size], "y_train": y[:train_size],
+        "X_test": X[train_size:], "y_test": y[train_size:],
+    }
+
+def _train_model(X_train, y_train, input_dim):
+    """Train an LSTM on (possibly multi-brand) training arrays."""
+    # from_numpy shares the float32 buffers instead of copying them
+    dataset = torch.utils.data.TensorDataset(
+        torch.from_numpy(X_train),
+        torch.from_numpy(y_train).view(-1, 1),
+    )
+    # Two persistent workers keep batches staged ahead of the GPU without
+    # re-forking per epoch; prefetch stays low since batches are tiny. On
+    # CPU there is no H2D copy to overlap, so forking workers to feed an
+    # in-memory TensorDataset would be pure IPC overhead — load in-process.
+    workers = 2 if device.type == "cuda" else 0
+    loader = torch.utils.data.DataLoader(
+        dataset, batch_size=BATCH_SIZE, shuffle=True, pin_memory=(device.type == "cuda"),
+        num_workers=workers, persistent_workers=workers > 0,
+        prefetch_factor=2 if workers else None,
+    )
+
+    model = LSTMModel(input_dim=input_dim).to(device)
+    # Fused kernels amortize nicely over the epoch loop on GPU
+    if device.type == "cuda" and hasattr(torch, "compile"):
+        model = torch.compile(model, mode="reduce-overhead")
+    else:
+        # nn.LSTM already lowers to the one-launch cuDNN kernel on GPU; on
+        # CPU, scripting lets the JIT fuse the pointwise gate chain instead
+        model = torch.jit.script(model)
+
+    criterion = nn.MSELoss()
+    # fused=True issues one multi-tensor CUDA kernel per step instead of a
+    # Python-level update per parameter tensor
+    optimizer = torch.optim.Adam(model.parameters(), lr=0.001, fused=torch.cuda.is_available())
+
+    # bf16 doubles LSTM matmul throughput on Ampere+; no GradScaler needed
+    use_bf16 = device.type == "cuda" and torch.cuda.is_bf16_supported()
+
+    model.train()
+    for epoch in range(EPOCHS):
+        for xb, yb in loader:
+            xb = xb.to(device, non_blocking=True)
+            yb = yb.to(device, non_blocking=True)
+            optimizer.zero_grad(set_to_none=True)  # cheaper than zeroing buffers
+            with torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=use_bf16):
+                output = model(xb)
+                loss = criterion(output, yb)
+            loss.backward()
+            optimizer.step()
+    return model
+
+def _seed_window(scaled, static_tail=None):
+    """Last SEQ_LENGTH rows of the scaled history, ready to seed a rollout."""
+    window = np.ascontiguousarray(scaled[-SEQ_LENGTH:], dtype=np.float32)
+    if static_tail is not None:
+        tail = np.broadcast_to(static_tail, (SEQ_LENGTH, static_tail.size))
+        window = np.concatenate([window, tail], axis=1).astype(np.float32)
+    return window
+
+def _evaluate(brand, model, X_test, y_test, seed_window=None):
+    """Score held-out windows; returns (metric_row, first rollout pred).
+
+    When `seed_window` is given it rides along as one extra row of the eval
+    batch, so the rollout's first step shares this forward pass instead of
+    paying its own batch-of-one launch. RMSE/MAPE are reduced on-device and
+    fetched as one tiny tensor — a single stream sync instead of pulling the
+    full prediction array back just to score it in NumPy.
+    """
+    model.eval()
+    batch = X_test if seed_window is None else np.concatenate([X_test, seed_window[None]])
+    X_t = _to_device(torch.from_numpy(batch))
+    y_t = _to_device(torch.from_numpy(y_test))
+    with torch.inference_mode():  # no autograd bookkeeping for eval
+        preds = model(X_t).ravel()
+        first_t = preds[-1] if seed_window is not None else preds.new_zeros(())
+        if seed_window is not None:
+            preds = preds[:-1]
+        err = preds - y_t
+        rmse_t = torch.sqrt(torch.mean(err * err))
+        mape_t = torch.mean(torch.abs(err) / torch.abs(y_t).clamp_min(torch.finfo(torch.float32).eps))
+        stats = torch.stack([rmse_t, mape_t, first_t]).cpu()  # one D2H sync
+
+    first_pred = float(stats[2]) if seed_window is not None else None
+    return {"Brand": brand, "RMSE": float(stats[0]), "MAPE (%)": float(stats[1]) * 100}, first_pred
+
+def _forecast_future(model, scaled, static_tail=None, steps=FORECAST_DAYS, first_pred=None):
+    """Autoregressive rollout: predict `steps` days of scaled Total_Sales.
+
+    `static_tail` (e.g. a brand one-hot) is appended to every timestep so
+    the same shared model can roll out any brand. `first_pred` (computed
+    during evaluation) skips the first forward pass of the loop.
+    """
+    model.eval()
+    feature_dim = scaled.shape[1]
+    tail_dim = 0 if static_tail is None else static_tail.size
+
+    # Device-resident rolling buffer: one H2D copy in and one D2H copy out,
+    # instead of a .item() stream sync plus np.vstack reallocation per step
+    buf = torch.empty(
+        (SEQ_LENGTH + steps, feature_dim + tail_dim), dtype=torch.float32, device=device
+    )
+    buf[:SEQ_LENGTH, :feature_dim] = _to_device(
+        torch.from_numpy(np.ascontiguousarray(scaled[-SEQ_LENGTH:], dtype=np.float32))
+    )
+    if tail_dim:
+        buf[:, feature_dim:] = _to_device(torch.from_numpy(static_tail))
+    # Non-sales features are held at their last observed values
+    last_features = buf[SEQ_LENGTH - 1, 1:feature_dim]
+
+    start = 0
+    if first_pred is not None:
+        buf[SEQ_LENGTH, 1:feature_dim] = last_features
+        buf[SEQ_LENGTH, 0] = first_pred
+        start = 1
+
+    with torch.inference_mode():  # no autograd bookkeeping for the rollout
+        for t in range(start, steps):
+            pred = model(buf[t:t + SEQ_LENGTH].unsqueeze(0))
+            buf[SEQ_LENGTH + t, 1:feature_dim] = last_features
+            buf[SEQ_LENGTH + t, 0] = pred.squeeze()  # update sales prediction only
+
+    return buf[SEQ_LENGTH:, :feature_dim].cpu().numpy()
+
+def _build_forecast_df(prep, future_scaled):
+    """Inverse-scale the rollout and attach future dates for one brand."""
+    brand_df = prep["brand_df"]
+
+    # Only Total_Sales needs inverse scaling — a scalar affine transform,
+    # not a full-width inverse_transform over padded constant columns
+    future_sales = future_scaled[:, 0] * prep["data_range"][0] + prep["data_min"][0]
+
+    # datetime64 arithmetic skips pd.date_range's Timestamp-object loop
+    start = brand_df["Date"].to_numpy().max() + np.timedelta64(1, "D")
+    future_dates = start + np.arange(FORECAST_DAYS, dtype="timedelta64[D]")
+    return pd.DataFrame({
+        "Date": future_dates,
+        "Brand": prep["brand"],
+        "Predicted_Sales": future_sales
+    })
+
+def _forecast_brand(brand, brand_df):
+    """Train an LSTM for one brand and return (forecast_df, metric_row).
+
+    Used by the mapped per-brand Airflow tasks; the single-process path in
+    run_lstm_forecast trains one shared model across brands instead.
+    Returns (None, None) when the brand has to be skipped.
+    """
+    prep = _prepare_brand(brand, brand_df)
+    if prep is None:
+        return None, None
+
+    model = _train_model(prep["X_train"], prep["y_train"], input_dim=len(prep["features"]))
+    metric_row, first_pred = _evaluate(
+        brand, model, prep["X_test"], prep["y_test"], seed_window=_seed_window(prep["scaled"])
+    )
+    future_scaled = _forecast_future(model, prep["scaled"], first_pred=first_pred)
+    return _build_forecast_df(prep, future_scaled), metric_row
+
+def _write_outputs(forecasts, metrics):
+    """Concatenate per-brand results and save forecast + metrics CSVs."""
+    if forecasts:
+        all_forecasts = pd.concat(forecasts, ignore_index=True)
+        # Arrow's multithreaded CSV writer beats pandas' row-by-row serializer
+        pacsv.write_csv(pa.Table.from_pandas(all_forecasts, preserve_index=False), FORECAST_FILE)
+        pacsv.write_csv(pa.Table.from_pandas(pd.DataFrame(metrics), preserve_index=False), METRICS_FILE)
+        print(f"✅ LSTM forecast saved at: {FORECAST_FILE}")
+        print(f"✅ Metrics saved at: {METRICS_FILE}")
+        print(pd.DataFrame(metrics).head())
+    else:
+        print("⚠️ No forecasts generated. Please check preprocessed data or feature consistency.")
+
+    return metrics
+
 # =======================================
 # MAIN FORECAST FUNCTION
 # =======================================
@@ -39,124 +324,83 @@ def run_lstm_forecast():
     if not os.path.exists(PROCESSED_FILE):
         raise FileNotFoundError(f"{PROCESSED_FILE} not found. Did preprocessing run?")
 
-    df = pd.read_csv(PROCESSED_FILE, parse_dates=["Date"], dayfirst=True)
-
-    extra_regressors = [
-        "Competitor_Price", "Category_Trend_Index", "Customer_Growth_Rate",
-        "Customer_Retention_Rate", "Stock_Level", "Supply_Delay_Days",
-        "Inflation_Rate", "Weather_Score", "Is_Holiday"
-    ]
-
-    forecasts, metrics = [], []
-    seq_length = 7  # Use previous 7 days to predict next day
-
-    for brand, brand_df in df.groupby("Brand"):
-        brand_df = brand_df.sort_values("Date")
+    df = pd.read_parquet(PROCESSED_FILE, engine="pyarrow")  # Date arrives pre-typed
+    df = _aggregate_daily(df)
 
-        # ✅ FIX: Ensure Date column is properly converted to datetime
-        brand_df["Date"] = pd.to_datetime(brand_df["Date"])
+    prepared = []
+    for brand, brand_df in df.groupby("Brand", sort=False):
+        prep = _prepare_brand(brand, brand_df)
+        if prep is not None:
+            prepared.append(prep)
 
-        # Aggregate multiple entries per date into a single row
-        agg_dict = {
-            "Total_Sales": "sum",
-            "Online_Popularity": "mean"
-        }
-        for reg in extra_regressors:
-            if reg in brand_df.columns:
-                agg_dict[reg] = "mean"
-        brand_df = brand_df.groupby("Date", as_index=False).agg(agg_dict)
+    if not prepared:
+        return _write_outputs([], [])
 
-        # Prepare features and verify their existence
-        features = ["Total_Sales", "Online_Popularity"] + [reg for reg in extra_regressors if reg in brand_df.columns]
+    # One shared model across brands: append a brand one-hot to every
+    # timestep and train once on the concatenated sequences, instead of
+    # running an 80-epoch loop per brand on tiny tensors (kernel-launch
+    # bound on GPU). Evaluation and rollout stay per brand.
+    num_brands = len(prepared)
+    brand_eye = np.eye(num_brands, dtype=np.float32)
+    X_all = np.concatenate(
+        [_append_onehot(prep["X_train"], brand_eye[i]) for i, prep in enumerate(prepared)]
+    )
+    y_all = np.concatenate([prep["y_train"] for prep in prepared])
 
-        if len(brand_df) < seq_length + 1:
-            print(f"Skipping {brand}: insufficient rows ({len(brand_df)}) to form sequences.")
-            continue
+    input_dim = len(prepared[0]["features"]) + num_brands
+    model = _train_model(X_all, y_all, input_dim)
 
-        feature_array = brand_df[features].values
+    forecasts, metrics = [], []
+    for i, prep in enumerate(prepared):
+        onehot = brand_eye[i]
+        metric_row, first_pred = _evaluate(
+            prep["brand"], model, _append_onehot(prep["X_test"], onehot), prep["y_test"],
+            seed_window=_seed_window(prep["scaled"], static_tail=onehot),
+        )
+        metrics.append(metric_row)
+        future_scaled = _forecast_future(
+            model, prep["scaled"], static_tail=onehot, first_pred=first_pred
+        )
+        forecasts.append(_build_forecast_df(prep, future_scaled))
+
+    return _write_outputs(forecasts, metrics)
+
+# ✅ Per-brand entrypoints for Airflow dynamic task mapping
+def forecast_lstm_one(brand):
+    """Train and forecast a single brand (one mapped task instance per brand).
+
+    Returns an XCom-serializable dict so the reducer task can concatenate
+    all brands without re-reading intermediate files.
+    """
+    if not os.path.exists(PROCESSED_FILE):
+        raise FileNotFoundError(f"{PROCESSED_FILE} not found. Did preprocessing run?")
 
-        scaler = MinMaxScaler()
-        scaled = scaler.fit_transform(feature_array)
+    df = pd.read_parquet(PROCESSED_FILE, engine="pyarrow")  # Date arrives pre-typed
+    brand_df = df[df["Brand"] == brand]
+    if brand_df.empty:
+        print(f"⚠️ No processed rows found for {brand}.")
+        return None
 
-        X, y = [], []
-        for i in range(len(scaled) - seq_length):
-            X.append(scaled[i:i+seq_length])
-            y.append(scaled[i + seq_length, 0])  # predict scaled Total_Sales
+    forecast_df, metric_row = _forecast_brand(brand, _aggregate_daily(brand_df))
+    if forecast_df is None:
+        return None
 
-        X, y = np.array(X), np.array(y)
+    forecast_df = forecast_df.copy()
+    forecast_df["Date"] = forecast_df["Date"].astype(str)  # JSON-safe for XCom
+    return {"forecast": forecast_df.to_dict("records"), "metrics": metric_row}
 
-        if len(X) < 20:
-            print(f"Skipping {brand}: not enough samples ({len(X)}) after sequence creation.")
+def combine_lstm_forecasts(results):
+    """Reducer for the mapped tasks: merge per-brand outputs and save CSVs."""
+    forecasts, metrics = [], []
+    for result in results:
+        if not result:
             continue
+        forecast_df = pd.DataFrame(result["forecast"])
+        forecast_df["Date"] = pd.to_datetime(forecast_df["Date"])
+        forecasts.append(forecast_df)
+        metrics.append(result["metrics"])
 
-        train_size = int(len(X) * 0.8)
-        X_train, y_train = X[:train_size], y[:train_size]
-        X_test, y_test = X[train_size:], y[train_size:]
-
-        X_train = torch.tensor(X_train, dtype=torch.float32).to(device)
-        y_train = torch.tensor(y_train, dtype=torch.float32).view(-1, 1).to(device)
-        X_test = torch.tensor(X_test, dtype=torch.float32).to(device)
-        y_test = torch.tensor(y_test, dtype=torch.float32).view(-1, 1).to(device)
-
-        model = LSTMModel(input_dim=len(features)).to(device)
-        criterion = nn.MSELoss()
-        optimizer = torch.optim.Adam(model.parameters(), lr=0.001)
-
-        # Training loop
-        for epoch in range(80):
-            model.train()
-            optimizer.zero_grad()
-            output = model(X_train)
-            loss = criterion(output, y_train)
-            loss.backward()
-            optimizer.step()
-
-        # Evaluation
-        model.eval()
-        preds = model(X_test).detach().cpu().numpy()
-        y_true = y_test.cpu().numpy()
-
-        rmse = np.sqrt(mean_squared_error(y_true, preds))
-        mape = mean_absolute_percentage_error(y_true, preds) * 100
-        metrics.append({"Brand": brand, "RMSE": rmse, "MAPE (%)": mape})
-
-        # Forecast 30 days ahead
-        last_seq = torch.tensor(scaled[-seq_length:], dtype=torch.float32).unsqueeze(0).to(device)
-        future_scaled = []
-        for _ in range(30):
-            pred = model(last_seq).item()
-            last_features = scaled[-1].copy()
-            next_step = np.array([pred] + list(last_features[1:]))  # update sales prediction only
-            future_scaled.append(next_step)
-            scaled = np.vstack([scaled, next_step])
-            last_seq = torch.tensor(scaled[-seq_length:], dtype=torch.float32).unsqueeze(0).to(device)
-
-        future_scaled = np.array(future_scaled)
-
-        # Build full inverse transform data with repeated features for non-sales columns
-        repeated_features = np.tile(brand_df[features[1:]].iloc[-1].values, (30, 1))
-        full_inverse_data = np.hstack([future_scaled[:, [0]], repeated_features])
-
-        future_sales = scaler.inverse_transform(full_inverse_data)[:, 0]
-
-        # ✅ FIXED: Now Date column is proper datetime, so this works
-        future_dates = pd.date_range(brand_df["Date"].max() + pd.Timedelta(days=1), periods=30)
-        forecasts.append(pd.DataFrame({
-            "Date": future_dates,
-            "Brand": brand,
-            "Predicted_Sales": future_sales
-        }))
-
-    if forecasts:
-        pd.concat(forecasts, ignore_index=True).to_csv(FORECAST_FILE, index=False)
-        pd.DataFrame(metrics).to_csv(METRICS_FILE, index=False)
-        print(f"✅ LSTM forecast saved at: {FORECAST_FILE}")
-        print(f"✅ Metrics saved at: {METRICS_FILE}")
-        print(pd.DataFrame(metrics).head())
-    else:
-        print("⚠️ No forecasts generated. Please check preprocessed data or feature consistency.")
-
-    return metrics
+    return _write_outputs(forecasts, metrics)
 
 # Export for Airflow
 def forecast_with_lstm():
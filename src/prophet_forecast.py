@@ -4,17 +4,24 @@ import os
 os.makedirs("/opt/airflow/tmp", exist_ok=True)
 os.environ["TMPDIR"] = "/opt/airflow/tmp"
 
+import hashlib
+import pickle
+
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from joblib import Memory
 from prophet import Prophet
 from sklearn.metrics import mean_absolute_percentage_error, mean_squared_error
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 
 # Configuration
 DATA_DIR = "data"
 FORECAST_DIR = os.path.join(DATA_DIR, "forecast")
 os.makedirs(FORECAST_DIR, exist_ok=True)
 
-PROCESSED_FILE = os.path.join(DATA_DIR, "processed", "processed_sales.csv")
+PROCESSED_FILE = os.path.join(DATA_DIR, "processed", "processed_sales.parquet")
 FORECAST_FILE = os.path.join(FORECAST_DIR, "prophet_forecast_results.csv")
 METRICS_FILE = os.path.join(FORECAST_DIR, "prophet_metrics.csv")
 
@@ -26,128 +33,226 @@ extra_regressors = [
     "Discount_Percentage", "Is_Holiday",
 ]
 
-def forecast_with_prophet():
-    if not os.path.exists(PROCESSED_FILE):
-        raise FileNotFoundError(f"{PROCESSED_FILE} not found. Run preprocessing first.")
+def _aggregate_daily(df):
+    """One global (Brand, Date) aggregation to get unique date-brand pairs.
 
-    df = pd.read_csv(PROCESSED_FILE, parse_dates=["Date"], dayfirst=True)
+    A single Cython groupby pass up front replaces the per-brand
+    groupby("Date") that used to run inside every loop iteration.
+    """
+    agg_dict = {"Total_Sales": "sum", "Online_Popularity": "mean"}
+    for reg in extra_regressors:
+        if reg in df.columns:
+            agg_dict[reg] = "mean"
+    return df.groupby(["Brand", "Date"], sort=True, observed=True, as_index=False).agg(agg_dict)
 
-    forecast_results, metrics = [], []
+# Fitted models persist across DAG runs: brands whose training rows are
+# unchanged day-to-day skip the Stan optimizer and only re-run predict().
+# Note: hits only occur when the upstream data is stable — with t0
+# regenerating the raw dataset from fresh RNG draws every run, every hash
+# is new, so the store is byte-capped and trimmed after each run to keep
+# misses from growing the disk unboundedly.
+_memory = Memory(os.path.join("/opt/airflow/tmp", "prophet_cache"), verbose=0, bytes_limit="256M")
 
-    for brand, brand_df in df.groupby("Brand"):
-        brand_df = brand_df.sort_values("Date")
+@_memory.cache(ignore=["train"])
+def _fit_brand(brand, train_hash, regressors_to_use, train):
+    """Fit Prophet on one brand's train frame; memoized on the data hash.
 
-        # Aggregate per date to ensure unique date-brand pairs
-        agg_dict = {"Total_Sales": "sum", "Online_Popularity": "mean"}
-        for reg in extra_regressors:
-            if reg in brand_df.columns:
-                agg_dict[reg] = "mean"
-        brand_df = brand_df.groupby("Date", as_index=False).agg(agg_dict)
+    `train` is excluded from the cache key — `train_hash` already covers any
+    numeric change — so joblib doesn't hash the frame a second time. Returns
+    the pickled model, which joblib stores on disk.
+    """
+    model = Prophet(
+        yearly_seasonality=True,
+        weekly_seasonality=True,
+        daily_seasonality=False,
+        seasonality_mode="multiplicative",
+        # 100 posterior draws are plenty for yhat_lower/upper bands and cut
+        # predict() time vs the default 1000; MAP fit only, no MCMC
+        uncertainty_samples=100,
+        mcmc_samples=0,
+    )
+    for reg in regressors_to_use:
+        model.add_regressor(reg)
+    model.fit(train)
+    return pickle.dumps(model)
 
-        used_regressors = [col for col in extra_regressors if col in brand_df.columns]
+def _forecast_brand(brand, brand_df):
+    """Fit Prophet for one brand and return (forecast_df, metric_row).
 
-        prophet_cols = ["Date", "Total_Sales", "Online_Popularity"] + used_regressors
-        prophet_df = brand_df[prophet_cols].rename(
-            columns={"Date": "ds", "Total_Sales": "y", "Online_Popularity": "Trend_Score"}
-        )
+    Expects the frame pre-aggregated by _aggregate_daily (sorted, one row
+    per date). Returns (None, None) when the brand has to be skipped.
+    """
+    used_regressors = [col for col in extra_regressors if col in brand_df.columns]
 
-        # Ensure ds is datetime
-        prophet_df["ds"] = pd.to_datetime(prophet_df["ds"])
+    prophet_cols = ["Date", "Total_Sales", "Online_Popularity"] + used_regressors
+    prophet_df = brand_df[prophet_cols].rename(
+        columns={"Date": "ds", "Total_Sales": "y", "Online_Popularity": "Trend_Score"}
+    )
 
-        # ====== CLEANING (RELAXED) ======
-        initial_length = len(prophet_df)
+    # ====== CLEANING (RELAXED) ======
+    initial_length = len(prophet_df)
 
-        # Replace infs with NaN
-        prophet_df = prophet_df.replace([np.inf, -np.inf], np.nan)
+    # Replace infs with NaN
+    prophet_df = prophet_df.replace([np.inf, -np.inf], np.nan)
 
-        # Require only y (target) to be valid and numeric
-        prophet_df = prophet_df.dropna(subset=["y"])
-        prophet_df = prophet_df[pd.to_numeric(prophet_df["y"], errors="coerce").notnull()]
+    # Require only y (target) to be valid and numeric
+    prophet_df = prophet_df.dropna(subset=["y"])
+    prophet_df = prophet_df[pd.to_numeric(prophet_df["y"], errors="coerce").notnull()]
 
-        dropped_rows = initial_length - len(prophet_df)
-        if dropped_rows > 0:
-            print(f"Dropped {dropped_rows} rows with invalid y for {brand}")
-        print(f"After cleaning, {brand} has {len(prophet_df)} rows")
-        # =================================
+    dropped_rows = initial_length - len(prophet_df)
+    if dropped_rows > 0:
+        print(f"Dropped {dropped_rows} rows with invalid y for {brand}")
+    print(f"After cleaning, {brand} has {len(prophet_df)} rows")
+    # =================================
 
-        print("Data types in train set:")
-        print(prophet_df.dtypes)
-        print("Describe target (y):")
-        print(prophet_df["y"].describe())
-        print("Unique sample dates:", prophet_df["ds"].unique()[:10])
+    print("Data types in train set:")
+    print(prophet_df.dtypes)
+    print("Describe target (y):")
+    print(prophet_df["y"].describe())
+    print("Unique sample dates:", prophet_df["ds"].unique()[:10])
 
-        if len(prophet_df) < 3:
-            print(f"⚠️ Skipping {brand} — insufficient data ({len(prophet_df)} rows after cleaning).")
-            continue
+    if len(prophet_df) < 3:
+        print(f"⚠️ Skipping {brand} — insufficient data ({len(prophet_df)} rows after cleaning).")
+        return None, None
 
-        train_size = int(len(prophet_df) * 0.8)
-        train, test = prophet_df[:train_size], prophet_df[train_size:]
+    train_size = int(len(prophet_df) * 0.8)
+    train, test = prophet_df[:train_size], prophet_df[train_size:]
 
-        print(f"Trying to fit brand: {brand}")
-        print("Train preview:", train.head(5))
-        print("NaNs per column in train:", train.isnull().sum())
-        print("Number of train rows:", len(train))
-        if len(train) < 2 or train.isnull().any().any():
-            print(f"⚠️ Skipping {brand}: Not enough valid train data or remaining NaNs.")
-            continue
-        if test.empty:
-            print(f"⚠️ Skipping {brand}: Test set is empty after cleaning.")
-            continue
+    print(f"Trying to fit brand: {brand}")
+    print("Train preview:", train.head(5))
+    print("NaNs per column in train:", train.isnull().sum())
+    print("Number of train rows:", len(train))
+    if len(train) < 2 or train.isnull().any().any():
+        print(f"⚠️ Skipping {brand}: Not enough valid train data or remaining NaNs.")
+        return None, None
+    if test.empty:
+        print(f"⚠️ Skipping {brand}: Test set is empty after cleaning.")
+        return None, None
 
-        # Exclude constant regressors
-        regressors_to_use = []
-        if "Trend_Score" in train.columns and train["Trend_Score"].nunique() > 1:
-            regressors_to_use.append("Trend_Score")
+    # Exclude constant regressors
+    regressors_to_use = []
+    if "Trend_Score" in train.columns and train["Trend_Score"].nunique() > 1:
+        regressors_to_use.append("Trend_Score")
+    else:
+        print(f"Regressor Trend_Score is constant for {brand}; skipping.")
+    for reg in used_regressors:
+        if reg in train.columns and train[reg].nunique() > 1:
+            regressors_to_use.append(reg)
         else:
-            print(f"Regressor Trend_Score is constant for {brand}; skipping.")
-        for reg in used_regressors:
-            if reg in train.columns and train[reg].nunique() > 1:
-                regressors_to_use.append(reg)
-            else:
-                print(f"Regressor {reg} is constant for {brand}; skipping.")
-
-        model = Prophet(
-            yearly_seasonality=True,
-            weekly_seasonality=True,
-            daily_seasonality=False,
-            seasonality_mode="multiplicative",
-        )
-        for reg in regressors_to_use:
-            model.add_regressor(reg)
-
-        train_predictors = ["ds", "y"] + regressors_to_use
-        test_predictors = ["ds"] + regressors_to_use
-
-        model.fit(train[train_predictors])
-        forecast_test = model.predict(test[test_predictors])
-        rmse = np.sqrt(mean_squared_error(test["y"], forecast_test["yhat"]))
-        mape = mean_absolute_percentage_error(test["y"], forecast_test["yhat"]) * 100
-        metrics.append({"Brand": brand, "RMSE": rmse, "MAPE (%)": mape})
-
-        future = model.make_future_dataframe(periods=30)
-        # Ensure both sides have datetime ds for merge
-        future["ds"] = pd.to_datetime(future["ds"])
-        prophet_df["ds"] = pd.to_datetime(prophet_df["ds"])
-
-        future = future.merge(prophet_df[["ds"] + regressors_to_use], on="ds", how="left")
-        for reg in regressors_to_use:
-            future[reg].fillna(method="ffill", inplace=True)
-        forecast = model.predict(future)
-        forecast["Brand"] = brand
-        forecast_results.append(forecast[["ds", "Brand", "yhat", "yhat_lower", "yhat_upper"]])
+            print(f"Regressor {reg} is constant for {brand}; skipping.")
+
+    train_predictors = ["ds", "y"] + regressors_to_use
+    test_predictors = ["ds"] + regressors_to_use
 
+    # blake2b over the raw train bytes: any numeric (or date) change gives a
+    # fresh key, identical data reuses the fit cached from a previous run
+    train_hash = hashlib.blake2b(
+        train[["y"] + regressors_to_use].to_numpy(dtype=np.float64).tobytes()
+        + train["ds"].to_numpy().tobytes()
+    ).hexdigest()
+    model = pickle.loads(_fit_brand(brand, train_hash, regressors_to_use, train[train_predictors]))
+    forecast_test = model.predict(test[test_predictors])
+    rmse = np.sqrt(mean_squared_error(test["y"], forecast_test["yhat"]))
+    mape = mean_absolute_percentage_error(test["y"], forecast_test["yhat"]) * 100
+    metric_row = {"Brand": brand, "RMSE": rmse, "MAPE (%)": mape}
+
+    # Both sides already carry datetime64 ds (parquet preserves the dtype)
+    future = model.make_future_dataframe(periods=30)
+    future = future.merge(prophet_df[["ds"] + regressors_to_use], on="ds", how="left")
+    # One block-wise ffill over all regressor columns at once; also drops the
+    # deprecated fillna(method=...) form
+    future.loc[:, regressors_to_use] = future[regressors_to_use].ffill()
+    forecast = model.predict(future)
+    forecast["Brand"] = brand
+    return forecast[["ds", "Brand", "yhat", "yhat_lower", "yhat_upper"]], metric_row
+
+def _forecast_brand_worker(args):
+    """Process-pool entrypoint: one brand fit per worker invocation."""
+    brand, brand_df = args
+    # Each worker gets its own cmdstan temp dir to avoid shared-tmp contention
+    worker_tmp = os.path.join("/opt/airflow/tmp", f"w{os.getpid()}")
+    os.makedirs(worker_tmp, exist_ok=True)
+    os.environ["TMPDIR"] = worker_tmp
+    return _forecast_brand(brand, brand_df)
+
+def _write_outputs(forecast_results, metrics):
+    """Concatenate per-brand results and save forecast + metrics CSVs."""
     if not forecast_results:
         print("⚠️ No forecasts generated. Check data availability per brand.")
         return
 
     all_forecasts = pd.concat(forecast_results, ignore_index=True)
     all_forecasts.rename(columns={"ds": "Date", "yhat": "Predicted_Sales"}, inplace=True)
-    all_forecasts.to_csv(FORECAST_FILE, index=False)
-    pd.DataFrame(metrics).to_csv(METRICS_FILE, index=False)
+    # Arrow's multithreaded CSV writer beats pandas' row-by-row serializer
+    pacsv.write_csv(pa.Table.from_pandas(all_forecasts, preserve_index=False), FORECAST_FILE)
+    pacsv.write_csv(pa.Table.from_pandas(pd.DataFrame(metrics), preserve_index=False), METRICS_FILE)
 
     print(f"✅ Prophet forecast & metrics saved in {FORECAST_DIR}")
     print(pd.DataFrame(metrics).head())
+
+    # Evict the oldest pickled fits beyond the byte budget set above
+    _memory.reduce_size()
     return metrics
 
+def forecast_with_prophet():
+    if not os.path.exists(PROCESSED_FILE):
+        raise FileNotFoundError(f"{PROCESSED_FILE} not found. Run preprocessing first.")
+
+    df = pd.read_parquet(PROCESSED_FILE, engine="pyarrow")  # Date arrives pre-typed
+
+    df = _aggregate_daily(df)
+
+    # Stan fits are CPU-bound and independent per brand, so fan them out
+    # over a process pool (threads would serialize on the optimizer)
+    groups = list(df.groupby("Brand", sort=False))
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        results = list(executor.map(_forecast_brand_worker, groups))
+
+    forecast_results, metrics = [], []
+    for forecast_df, metric_row in results:
+        if forecast_df is None:
+            continue
+        forecast_results.append(forecast_df)
+        metrics.append(metric_row)
+
+    return _write_outputs(forecast_results, metrics)
+
+# ✅ Per-brand entrypoints for Airflow dynamic task mapping
+def forecast_prophet_one(brand):
+    """Fit and forecast a single brand (one mapped task instance per brand).
+
+    Returns an XCom-serializable dict so the reducer task can concatenate
+    all brands without re-reading intermediate files.
+    """
+    if not os.path.exists(PROCESSED_FILE):
+        raise FileNotFoundError(f"{PROCESSED_FILE} not found. Run preprocessing first.")
+
+    df = pd.read_parquet(PROCESSED_FILE, engine="pyarrow")  # Date arrives pre-typed
+    brand_df = df[df["Brand"] == brand]
+    if brand_df.empty:
+        print(f"⚠️ No processed rows found for {brand}.")
+        return None
+
+    forecast_df, metric_row = _forecast_brand(brand, _aggregate_daily(brand_df))
+    if forecast_df is None:
+        return None
+
+    forecast_df = forecast_df.copy()
+    forecast_df["ds"] = forecast_df["ds"].astype(str)  # JSON-safe for XCom
+    return {"forecast": forecast_df.to_dict("records"), "metrics": metric_row}
+
+def combine_prophet_forecasts(results):
+    """Reducer for the mapped tasks: merge per-brand outputs and save CSVs."""
+    forecast_results, metrics = [], []
+    for result in results:
+        if not result:
+            continue
+        forecast_df = pd.DataFrame(result["forecast"])
+        forecast_df["ds"] = pd.to_datetime(forecast_df["ds"])
+        forecast_results.append(forecast_df)
+        metrics.append(result["metrics"])
+
+    return _write_outputs(forecast_results, metrics)
+
 if __name__ == "__main__":
     forecast_with_prophet()
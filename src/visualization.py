@@ -1,9 +1,11 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import matplotlib.pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
 import seaborn as sns
 import os
 from datetime import datetime
-from fpdf import FPDF
 
 # =======================================
 # CONFIGURATION
@@ -17,9 +19,39 @@ os.makedirs(FORECAST_DIR, exist_ok=True)
 plt.style.use("seaborn-v0_8-darkgrid")
 sns.set_palette("Set2")
 
+VIZ_INPUT_FILES = [
+    "prophet_forecast_results.csv",
+    "lstm_forecast_results.csv",
+    "prophet_metrics.csv",
+    "lstm_metrics.csv",
+]
+VIZ_SIG_FILE = os.path.join(FORECAST_DIR, ".viz.sig")
+
+def _inputs_digest():
+    """blake2b digest over the forecast input files, streamed in 4KB chunks."""
+    sig = hashlib.blake2b()
+    for name in VIZ_INPUT_FILES:
+        path = os.path.join(FORECAST_DIR, name)
+        if not os.path.exists(path):
+            continue
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(4096), b""):
+                sig.update(block)
+    return sig.hexdigest()
+
 def generate_visualizations():
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
+    # Content-hash gate: if none of the forecast inputs changed since the
+    # last run, every PNG and the PDF would come out identical — skip the
+    # whole matplotlib pass instead of re-rendering it.
+    digest = _inputs_digest()
+    if os.path.exists(VIZ_SIG_FILE):
+        with open(VIZ_SIG_FILE) as f:
+            if f.read().strip() == digest:
+                print("⏭️ Forecast inputs unchanged since last run. Skipping visualization.")
+                return
+
     def safe_load_csv(file_path, name):
         if os.path.exists(file_path):
             return pd.read_csv(file_path)
@@ -31,7 +63,13 @@ def generate_visualizations():
     lstm_df = safe_load_csv(os.path.join(FORECAST_DIR, "lstm_forecast_results.csv"), "LSTM Forecast")
     prophet_metrics = safe_load_csv(os.path.join(FORECAST_DIR, "prophet_metrics.csv"), "Prophet Metrics")
     lstm_metrics = safe_load_csv(os.path.join(FORECAST_DIR, "lstm_metrics.csv"), "LSTM Metrics")
-    processed_sales = safe_load_csv(os.path.join(DATA_DIR, "processed_sales.csv"), "Processed Sales")
+
+    processed_path = os.path.join(DATA_DIR, "processed", "processed_sales.parquet")
+    if os.path.exists(processed_path):
+        processed_sales = pd.read_parquet(processed_path, engine="pyarrow")
+    else:
+        print(f"⚠️ Processed Sales file missing: {processed_path}")
+        processed_sales = pd.DataFrame()
 
     if processed_sales.empty:
         print("⚠️ Processed sales data is empty. Skipping visualization.")
@@ -45,62 +83,10 @@ def generate_visualizations():
     if not lstm_df.empty:
         lstm_df["Date"] = pd.to_datetime(lstm_df["Date"])
 
-    # BRAND FORECAST COMPARISONS
-    if not prophet_df.empty and not lstm_df.empty:
-        for brand in prophet_df["Brand"].unique():
-            p_df = prophet_df[prophet_df["Brand"] == brand]
-            l_df = lstm_df[lstm_df["Brand"] == brand]
-
-            plt.figure(figsize=(10, 5))
-            plt.plot(p_df["Date"], p_df["Predicted_Sales"], label="Prophet", linewidth=2)
-            plt.plot(l_df["Date"], l_df["Predicted_Sales"], label="LSTM", linewidth=2)
-            plt.title(f"Forecast Comparison - {brand}")
-            plt.xlabel("Date")
-            plt.ylabel("Predicted Sales")
-            plt.legend()
-            plt.tight_layout()
-            plt.savefig(os.path.join(PLOTS_DIR, f"{brand}_comparison.png"), dpi=300)
-            plt.close()
-
-    # TOP 5 BRANDS - Prophet vs LSTM
-    if not prophet_df.empty and not lstm_df.empty:
-        top5_p = prophet_df.groupby("Brand")["Predicted_Sales"].mean().nlargest(5).reset_index()
-        top5_l = lstm_df.groupby("Brand")["Predicted_Sales"].mean().nlargest(5).reset_index()
-
-        plt.figure(figsize=(8, 5))
-        sns.barplot(data=top5_p, x="Brand", y="Predicted_Sales", color="skyblue", label="Prophet")
-        sns.barplot(data=top5_l, x="Brand", y="Predicted_Sales", color="salmon", alpha=0.7, label="LSTM")
-        plt.title("Top 5 Predicted Performing Brands - Prophet vs LSTM")
-        plt.legend()
-        plt.tight_layout()
-        plt.savefig(os.path.join(PLOTS_DIR, "top5_brands_comparison.png"), dpi=300)
-        plt.close()
-
-    # METRICS COMPARISON
-    if not prophet_metrics.empty and not lstm_metrics.empty:
-        metrics = prophet_metrics.merge(lstm_metrics, on="Brand", suffixes=("_Prophet", "_LSTM"))
-
-        # RMSE
-        plt.figure(figsize=(8, 5))
-        sns.barplot(data=metrics, x="Brand", y="RMSE_Prophet", color="skyblue", label="Prophet RMSE")
-        sns.barplot(data=metrics, x="Brand", y="RMSE_LSTM", color="salmon", alpha=0.7, label="LSTM RMSE")
-        plt.title("RMSE Comparison - Prophet vs LSTM")
-        plt.legend()
-        plt.tight_layout()
-        plt.savefig(os.path.join(PLOTS_DIR, "rmse_comparison.png"), dpi=300)
-        plt.close()
-
-        # MAPE
-        plt.figure(figsize=(8, 5))
-        sns.barplot(data=metrics, x="Brand", y="MAPE (%)_Prophet", color="skyblue", label="Prophet MAPE")
-        sns.barplot(data=metrics, x="Brand", y="MAPE (%)_LSTM", color="salmon", alpha=0.7, label="LSTM MAPE")
-        plt.title("MAPE (%) Comparison - Prophet vs LSTM")
-        plt.legend()
-        plt.tight_layout()
-        plt.savefig(os.path.join(PLOTS_DIR, "mape_comparison.png"), dpi=300)
-        plt.close()
-
-    # COMBINE FORECAST RESULTS
+    # COMBINE FORECAST RESULTS — the summary only needs the loaded frames,
+    # so it is produced (and its Telegram sends kicked off) before the
+    # PDF render rather than after it
+    summary_file = os.path.join(FORECAST_DIR, "brand_forecast_summary.txt")
     if not prophet_df.empty and not lstm_df.empty:
         next_month_p = prophet_df.groupby("Brand")["Predicted_Sales"].mean()
         next_month_l = lstm_df.groupby("Brand")["Predicted_Sales"].mean()
@@ -118,46 +104,112 @@ def generate_visualizations():
             f"Most Trending Brand Right Now (Social buzz): {trending_brand}"
         )
 
-        with open(os.path.join(FORECAST_DIR, "brand_forecast_summary.txt"), "w") as f:
+        with open(summary_file, "w") as f:
             f.write(summary_text)
 
         print("\n✅ Final Forecast Decision")
         print(summary_text)
 
-    # PDF REPORT
-    pdf = FPDF()
-    pdf.set_auto_page_break(auto=True, margin=15)
-
-    pdf.add_page()
-    pdf.set_font("Arial", "B", 16)
-    pdf.cell(0, 10, "Brand Forecasting Report", ln=True, align="C")
-    pdf.set_font("Arial", size=12)
-    pdf.ln(10)
-    pdf.cell(0, 10, f"Generated on: {timestamp}", ln=True, align="C")
-    pdf.ln(10)
-    pdf.multi_cell(0, 10,
+    # SEND TO TELEGRAM — each send is a blocking HTTPS round-trip, so the
+    # message sends run in background threads while matplotlib renders the
+    # report; the document send joins the pool once the PDF is closed
+    from telegram_alert import send_telegram_message, send_telegram_document
+
+    executor = ThreadPoolExecutor(max_workers=3)
+    sends = [executor.submit(send_telegram_message, "✅ Forecast pipeline completed! Sending report…")]
+    if os.path.exists(summary_file):
+        with open(summary_file, "r") as f:
+            sends.append(executor.submit(send_telegram_message, f.read()))
+
+    # PDF REPORT — pages are appended while the figures are still alive,
+    # which skips fpdf's re-loading and re-embedding of every PNG
+    report_pdf = os.path.join(FORECAST_DIR, "forecast_report.pdf")
+    pdf_pages = PdfPages(report_pdf)
+
+    # Title page
+    title_fig = plt.figure(figsize=(8.27, 11.69))
+    title_fig.text(0.5, 0.70, "Brand Forecasting Report", ha="center", fontsize=20, weight="bold")
+    title_fig.text(0.5, 0.62, f"Generated on: {timestamp}", ha="center", fontsize=12)
+    title_fig.text(
+        0.5, 0.50,
         "This report compares forecasts from Prophet and a Deep 2-Layer LSTM model.\n"
-        "It contains accuracy metrics (RMSE, MAPE) and forecast trend visuals."
+        "It contains accuracy metrics (RMSE, MAPE) and forecast trend visuals.",
+        ha="center", fontsize=11,
     )
+    pdf_pages.savefig(title_fig)
+    plt.close(title_fig)
 
-    for file in sorted(os.listdir(PLOTS_DIR)):
-        if file.endswith(".png"):
-            pdf.add_page()
-            pdf.image(os.path.join(PLOTS_DIR, file), x=10, y=25, w=180)
+    # BRAND FORECAST COMPARISONS — one reused figure, cleared per brand,
+    # instead of a fresh Figure allocation and Agg setup per savefig
+    if not prophet_df.empty and not lstm_df.empty:
+        fig, ax = plt.subplots(figsize=(10, 5))
+        for brand in prophet_df["Brand"].unique():
+            p_df = prophet_df[prophet_df["Brand"] == brand]
+            l_df = lstm_df[lstm_df["Brand"] == brand]
 
-    pdf.output(os.path.join(FORECAST_DIR, "forecast_report.pdf"))
-    print("📘 Forecast visualization PDF generated.")
+            ax.cla()
+            ax.plot(p_df["Date"], p_df["Predicted_Sales"], label="Prophet", linewidth=2)
+            ax.plot(l_df["Date"], l_df["Predicted_Sales"], label="LSTM", linewidth=2)
+            ax.set_title(f"Forecast Comparison - {brand}")
+            ax.set_xlabel("Date")
+            ax.set_ylabel("Predicted Sales")
+            ax.legend()
+            fig.tight_layout()
+            fig.savefig(os.path.join(PLOTS_DIR, f"{brand}_comparison.png"), dpi=300)
+            pdf_pages.savefig(fig)
+        plt.close(fig)
 
-    # SEND TO TELEGRAM (added without modifying logic)
-    from telegram_alert import send_telegram_message, send_telegram_document
+    # TOP 5 BRANDS - Prophet vs LSTM
+    if not prophet_df.empty and not lstm_df.empty:
+        top5_p = prophet_df.groupby("Brand")["Predicted_Sales"].mean().nlargest(5).reset_index()
+        top5_l = lstm_df.groupby("Brand")["Predicted_Sales"].mean().nlargest(5).reset_index()
 
-    summary_file = os.path.join(FORECAST_DIR, "brand_forecast_summary.txt")
-    report_pdf = os.path.join(FORECAST_DIR, "forecast_report.pdf")
+        fig, ax = plt.subplots(figsize=(8, 5))
+        sns.barplot(data=top5_p, x="Brand", y="Predicted_Sales", color="skyblue", label="Prophet", ax=ax)
+        sns.barplot(data=top5_l, x="Brand", y="Predicted_Sales", color="salmon", alpha=0.7, label="LSTM", ax=ax)
+        ax.set_title("Top 5 Predicted Performing Brands - Prophet vs LSTM")
+        ax.legend()
+        fig.tight_layout()
+        fig.savefig(os.path.join(PLOTS_DIR, "top5_brands_comparison.png"), dpi=300)
+        pdf_pages.savefig(fig)
+        plt.close(fig)
 
-    send_telegram_message("✅ Forecast pipeline completed! Sending report…")
+    # METRICS COMPARISON
+    if not prophet_metrics.empty and not lstm_metrics.empty:
+        metrics = prophet_metrics.merge(lstm_metrics, on="Brand", suffixes=("_Prophet", "_LSTM"))
 
-    if os.path.exists(summary_file):
-        with open(summary_file, "r") as f:
-            send_telegram_message(f.read())
+        fig, ax = plt.subplots(figsize=(8, 5))
+
+        # RMSE
+        sns.barplot(data=metrics, x="Brand", y="RMSE_Prophet", color="skyblue", label="Prophet RMSE", ax=ax)
+        sns.barplot(data=metrics, x="Brand", y="RMSE_LSTM", color="salmon", alpha=0.7, label="LSTM RMSE", ax=ax)
+        ax.set_title("RMSE Comparison - Prophet vs LSTM")
+        ax.legend()
+        fig.tight_layout()
+        fig.savefig(os.path.join(PLOTS_DIR, "rmse_comparison.png"), dpi=300)
+        pdf_pages.savefig(fig)
+
+        # MAPE
+        ax.cla()
+        sns.barplot(data=metrics, x="Brand", y="MAPE (%)_Prophet", color="skyblue", label="Prophet MAPE", ax=ax)
+        sns.barplot(data=metrics, x="Brand", y="MAPE (%)_LSTM", color="salmon", alpha=0.7, label="LSTM MAPE", ax=ax)
+        ax.set_title("MAPE (%) Comparison - Prophet vs LSTM")
+        ax.legend()
+        fig.tight_layout()
+        fig.savefig(os.path.join(PLOTS_DIR, "mape_comparison.png"), dpi=300)
+        pdf_pages.savefig(fig)
+        plt.close(fig)
+
+    pdf_pages.close()
+    print("📘 Forecast visualization PDF generated.")
+
+    sends.append(executor.submit(send_telegram_document, report_pdf, caption="📊 Brand Forecast Report Ready ✅"))
+
+    # Surface any send failure before declaring the run done
+    for send in sends:
+        send.result()
+    executor.shutdown()
 
-    send_telegram_document(report_pdf, caption="📊 Brand Forecast Report Ready ✅")
+    # Remember what these outputs were built from so no-op reruns can skip
+    with open(VIZ_SIG_FILE, "w") as f:
+        f.write(digest)